@@ -1,103 +1,438 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import pandas as pd
+import numpy as np
+import pyarrow as pa
 import plotly.graph_objects as go
+import contextlib
+import functools
+import hashlib
+import json
+import logging
+import pathlib
+import time
+import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson # Optional: faster decoding of the multi-MB OKX instrument payloads
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
 
 # --- Configuration ---
 OKX_API_BASE = "https://www.okx.com/api/v5/"
+CURRENCIES = ["BTC", "ETH"]
+STATIC_CHART_MIN_BARS = 500 # Expirations with more call+put bars than this default to a static chart
+UNIFIED_HOVER_MAX_BARS = 100 # Above this many bars, hover per bar instead of across the whole x position
+REQUEST_TIMEOUT = 15 # Seconds
+CHART_WIDTH = 1200 # Pixels; a fixed-width chart is never re-laid out when the page is resized
+
+# Raw OKX response bodies are cached on disk so they survive restarts and are shared across sessions
+DISK_CACHE_DIR = pathlib.Path(".cache/okx")
+DISK_CACHE_TTL = 300 # Seconds
+
+# Fields read from each market/instruments record; everything else OKX returns is ignored
+_OKX_KEEP = ('instId', 'stk', 'optType', 'vol24h', 'expTime')
+
+# Shared HTTP session so consecutive OKX calls reuse the pooled keep-alive connection.
+# Held in st.cache_resource because Streamlit re-executes this module on every rerun.
+@st.cache_resource
+def _get_session():
+    session = requests.Session()
+    session.headers.update({
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+        "Accept": "application/json" # Explicitly request JSON
+    })
+    # Up to two concurrent requests per currency (the selected one plus background prefetches), all to one host
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2 * len(CURRENCIES)))
+    return session
+
+_SESSION = _get_session()
+
+# Long-lived workers for the concurrent OKX requests, so a cache miss doesn't spawn fresh threads
+@st.cache_resource
+def _get_fetch_pool():
+    return ThreadPoolExecutor(max_workers=2 * len(CURRENCIES), thread_name_prefix="okx-fetch")
+
+_FETCH_POOL = _get_fetch_pool()
+
+# Status and start of the latest OKX responses per currency, recorded by load_okx_data for the debug panel.
+# load_okx_data itself makes no st.* calls, so it can also run on a prefetch thread with no script context.
+@st.cache_resource
+def _get_response_log():
+    return {}
+
+_RESPONSE_LOG = _get_response_log()
+
+# --- Cache Instrumentation ---
+
+@st.cache_resource
+def _cache_stats(name: str):
+    """Call/miss counters for one observed_cache function, kept for the process lifetime across reruns."""
+    return {'calls': 0, 'hits': 0, 'misses': 0, 'last_ms': 0.0}
+
+def observed_cache(ttl: int):
+    """
+    Drop-in replacement for st.cache_data(ttl=...) that also records calls, cache hits, misses and
+    the last call's wall time (ms) in the wrapper's `stats` dict. A miss is counted inside the
+    function st.cache_data executes, so only real recomputations count; hits are calls minus misses.
+    """
+    def decorator(fn):
+        stats = _cache_stats(fn.__qualname__)
+
+        # Wrapped with functools.wraps so st.cache_data still keys the cache on fn's name and source
+        @functools.wraps(fn)
+        def counted(*args, **kwargs):
+            stats['misses'] += 1
+            return fn(*args, **kwargs)
+
+        cached = st.cache_data(ttl=ttl)(counted)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            stats['calls'] += 1
+            try:
+                return cached(*args, **kwargs)
+            finally:
+                stats['last_ms'] = (time.perf_counter() - start) * 1000
+                stats['hits'] = stats['calls'] - stats['misses']
+
+        wrapper.stats = stats
+        return wrapper
+    return decorator
 
 # --- Helper Functions to Fetch Data ---
 
-# @st.cache_data(ttl=300) # Temporarily disable caching to ensure fresh requests for debugging
-def get_okx_data(currency: str):
+class OKXAPIError(Exception):
+    """OKX answered HTTP 200 but reported an API-level error (a "code" other than "0") in the body."""
+
+def _fetch_raw(url: str, params: dict, timeout: int, disk_cache: bool = True):
     """
-    Fetches options instrument data (including volume) and index price from OKX.
-    Returns a DataFrame of options data and the current index price.
+    GETs url over the shared session and returns (decoded payload, raw body bytes, status, fetch time).
+    With disk_cache, a body fetched less than DISK_CACHE_TTL seconds ago is read back from DISK_CACHE_DIR
+    instead, with status "disk cache" and the file's mtime as its fetch time. HTTP errors and OKX API
+    errors are raised and never cached; failing to write the cache file is ignored.
     """
-    request_timeout = 15 # Seconds
+    key = hashlib.md5(f"{url}|{sorted(params.items())}".encode()).hexdigest()
+    path = DISK_CACHE_DIR / f"{key}.json"
+    if disk_cache and path.exists():
+        cached_at = path.stat().st_mtime
+        if time.time() - cached_at < DISK_CACHE_TTL:
+            raw = path.read_bytes()
+            return _parse_json(raw), raw, "disk cache", cached_at
 
+    response = _SESSION.get(url, params=params, timeout=timeout)
+    response.raise_for_status() # Raise an exception for HTTP errors (like 4xx or 5xx)
+    fetched_at = time.time()
+    raw = response.content
+    payload = _parse_json(raw)
+    # OKX reports API errors in the body of an HTTP 200, with an empty "data" list
+    if payload.get("code") != "0":
+        raise OKXAPIError(f"code {payload.get('code')}: {payload.get('msg') or 'no message'}")
+
+    # Write under a per-thread temp name and swap it in, so concurrent readers never see a partial file.
+    # The disk cache is best-effort: an unwritable cache directory must not cost us a good response.
+    if disk_cache and payload.get("data"):
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            DISK_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(raw)
+            tmp_path.replace(path)
+        except OSError:
+            with contextlib.suppress(OSError):
+                tmp_path.unlink(missing_ok=True)
+    return payload, raw, response.status_code, fetched_at
+
+def _parse_json(raw: bytes):
+    """Decodes a raw response body with orjson when it is installed, otherwise with the stdlib json module."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+class NoOptionsDataError(Exception):
+    """OKX answered, but with no options left to show; the message is the warning shown to the user."""
+
+def _is_live(record, cutoff_ms: int):
+    """True if an OKX instrument record has a strike and expires at or after cutoff_ms (epoch ms)."""
     try:
-        underlying_asset = f"{currency}-USD"
-
-        # --- Options Instruments Endpoint ---
-        options_url = f"{OKX_API_BASE}market/instruments"
-        options_params = {"instType": "OPTION", "uly": underlying_asset}
-        
-        # --- Debugging: Print the full URL being requested ---
-        full_options_url = f"{options_url}?{requests.utils.urlencode(options_params)}"
-        st.subheader("⚙️ Debugging API Request:")
-        st.write(f"**1. Requesting Options Instruments URL:** `{full_options_url}`")
-        
-        # Add a User-Agent header to mimic a browser
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Accept": "application/json" # Explicitly request JSON
-        }
-        st.write(f"**2. Request Headers:** `{headers}`")
-
-        options_response = requests.get(options_url, params=options_params, timeout=request_timeout, headers=headers)
-        
-        # --- Debugging: Print status code and response text ---
-        st.write(f"**3. Options Instruments Response Status Code:** `{options_response.status_code}`")
-        st.write(f"**4. Options Instruments Raw Response Content (first 500 chars):** `{options_response.text[:500]}`")
-        
-        options_response.raise_for_status() # Raise an exception for HTTP errors (like 4xx or 5xx)
-        instrument_data = options_response.json().get("data", [])
-
-        if not instrument_data:
-            st.warning(f"No options data found for {currency} from OKX. Check the currency, underlying asset, or API status.")
-            return pd.DataFrame(), None
-
-        df = pd.DataFrame(instrument_data)
-
-        # OKX market/instruments specific parsing
-        df['instrument_name'] = df['instId']
-        df['strike'] = pd.to_numeric(df['stk'], errors='coerce')
-        df['option_type'] = df['optType'].apply(lambda x: 'call' if x == 'C' else 'put')
-        df['volume_24h'] = pd.to_numeric(df['vol24h'], errors='coerce').fillna(0)
-        df['expiration_date'] = pd.to_datetime(df['expTime'], unit='ms')
-
-        df = df[['instrument_name', 'strike', 'option_type', 'volume_24h', 'expiration_date']].dropna(subset=['strike'])
-        
-        # --- Index Price Endpoint ---
-        index_url = f"{OKX_API_BASE}market/index-tickers"
-        index_params = {"instId": underlying_asset}
-        
-        # --- Debugging: Print the full URL being requested for index ---
-        full_index_url = f"{index_url}?{requests.utils.urlencode(index_params)}"
-        st.write(f"**5. Requesting Index Price URL:** `{full_index_url}`")
-
-        index_response = requests.get(index_url, params=index_params, timeout=request_timeout, headers=headers)
-        
-        # --- Debugging: Print status code and response text for index ---
-        st.write(f"**6. Index Price Response Status Code:** `{index_response.status_code}`")
-        st.write(f"**7. Index Price Raw Response Content (first 500 chars):** `{index_response.text[:500]}`")
-
-        index_response.raise_for_status()
-        index_price_data = index_response.json().get("data", [])
-        
-        index_price = None
-        if index_price_data:
-            index_price = float(index_price_data[0].get("idxPx"))
-
-        return df, index_price
+        return bool(record.get('stk')) and int(record['expTime']) >= cutoff_ms
+    except (KeyError, TypeError, ValueError):
+        return False
+
+def _okx_requests(currency: str):
+    """The (url, params) pairs for one currency's options-instruments and index-price requests."""
+    underlying_asset = f"{currency}-USD"
+    return (
+        (f"{OKX_API_BASE}market/instruments", {"instType": "OPTION", "uly": underlying_asset}),
+        (f"{OKX_API_BASE}market/index-tickers", {"instId": underlying_asset}),
+    )
+
+@observed_cache(ttl=300)
+def load_okx_data(currency: str, as_of):
+    """
+    Fetches options instrument data (including volume) and index price from OKX, keeping only
+    options that expire on or after the `as_of` date (also part of the cache key, so a cached
+    chain never outlives the day it was filtered for). Returns:
+    - an Arrow table of options data sorted by expiration day, option type and strike
+    - the current index price, or None if OKX didn't return one
+    - a dict mapping (expiration day as 'YYYY-MM-DD', option type) to that group's slice of rows
+    - the time OKX served the chain (epoch seconds), which identifies this snapshot of it
+    Errors and empty chains (NoOptionsDataError) are raised, so st.cache_data never memoizes them.
+    """
+    (options_url, options_params), (index_url, index_params) = _okx_requests(currency)
+
+    # The two requests are independent, so fire them concurrently over the shared session.
+    # Only the chain goes through the disk cache: st.cache_data already holds the result for up to 300 s,
+    # so a disk-cached index price on top of that could be twice as stale.
+    options_future = _FETCH_POOL.submit(_fetch_raw, options_url, options_params, REQUEST_TIMEOUT)
+    index_future = _FETCH_POOL.submit(_fetch_raw, index_url, index_params, REQUEST_TIMEOUT, disk_cache=False)
+    options_payload, options_raw, options_status, fetched_at = options_future.result()
+    index_payload, index_raw, index_status, _ = index_future.result()
+
+    # Kept for get_okx_data's debug panel rather than written here, so this function stays free of st.* calls
+    _RESPONSE_LOG[currency] = dict(
+        options_status=options_status,
+        options_head=options_raw[:500].decode('utf-8', errors='replace'),
+        index_status=index_status,
+        index_head=index_raw[:500].decode('utf-8', errors='replace'),
+    )
+
+    instrument_data = options_payload.get("data", [])
+
+    if not instrument_data:
+        raise NoOptionsDataError(f"No options data found for {currency} from OKX. Check the currency, underlying asset, or API status.")
+
+    # Drop already-expired and strike-less options on the raw records, before the DataFrame is built.
+    # The cutoff is midnight of the as_of date, so only expirations from that day onwards are kept.
+    cutoff_ms = pd.Timestamp(as_of).value // 10**6
+    instrument_data = [d for d in instrument_data if _is_live(d, cutoff_ms)]
+
+    if not instrument_data:
+        raise NoOptionsDataError(f"No future expiration dates available for {currency}.")
+
+    # Read only the fields we use instead of all 20+ OKX fields: one pass over the records, then
+    # transpose the rows into raw per-field columns that never become DataFrame columns themselves
+    rows = [tuple(map(d.get, _OKX_KEEP)) for d in instrument_data]
+    inst_ids, raw_strikes, opt_types, raw_volumes, exp_times = zip(*rows)
+
+    # OKX market/instruments specific parsing
+    # float32 holds strikes and 24h contract volumes exactly enough and halves the columns' footprint
+    strikes = pd.to_numeric(raw_strikes, errors='coerce').astype(np.float32)
+    # Two-value categorical: 1 byte per row, and calls (code 0) still sort ahead of puts
+    option_types = pd.Categorical.from_codes(
+        (np.asarray(opt_types, dtype=object) != 'C').astype(np.int8), categories=['call', 'put']
+    )
+    volumes = np.nan_to_num(pd.to_numeric(raw_volumes, errors='coerce'), nan=0).astype(np.float32)
+    # _is_live has already checked every expTime parses as an int, so convert the raw strings in one
+    # pass instead of going through pd.to_numeric's object-column inference
+    exp_ms = np.fromiter(map(int, exp_times), dtype=np.int64, count=len(exp_times))
+    # A chain has only a few dozen distinct expiries: convert each one once and broadcast back to the rows
+    unique_exp_ms, exp_index = np.unique(exp_ms, return_inverse=True)
+    unique_expirations = pd.to_datetime(unique_exp_ms, unit='ms').to_numpy()
 
+    df = pd.DataFrame({
+        'instrument_name': inst_ids,
+        'strike': strikes,
+        'option_type': option_types,
+        'volume_24h': volumes,
+        'expiration_date': unique_expirations[exp_index],
+        # Calendar day of expiry, truncated once here so reruns never need a .dt.normalize() pass
+        'expiration_day': unique_expirations.astype('datetime64[D]')[exp_index],
+    }).dropna(subset=['strike'])
+
+
+    index_price_data = index_payload.get("data", [])
+    
+    index_price = None
+    if index_price_data:
+        index_price = float(index_price_data[0].get("idxPx"))
+
+    # Sort once so every (expiration day, option type) group is a contiguous, strike-ordered block,
+    # then record each block's bounds so reruns can slice instead of filtering and re-sorting
+    df = df.sort_values(['expiration_day', 'option_type', 'strike'], kind='mergesort', ignore_index=True)
+    # The frame is sorted, so each group is a run of equal (day, type) values: find the run starts with
+    # one vectorized comparison against the previous row rather than a second groupby pass
+    days = df['expiration_day'].to_numpy()
+    type_codes = df['option_type'].cat.codes.to_numpy()
+    type_labels = df['option_type'].cat.categories
+    changes = (days[1:] != days[:-1]) | (type_codes[1:] != type_codes[:-1])
+    run_starts = np.flatnonzero(np.r_[len(df) > 0, changes]) # No runs at all for an empty frame
+    run_stops = np.r_[run_starts[1:], len(df)]
+    expiration_bounds = {
+        (np.datetime_as_string(days[start], unit='D'), type_labels[type_codes[start]]): slice(int(start), int(stop))
+        for start, stop in zip(run_starts, run_stops)
+    }
+
+    # Hand back an Arrow table: it pickles in and out of st.cache_data far faster than a DataFrame,
+    # and callers only need column arrays and row slices, both zero-copy on a table
+    return pa.Table.from_pandas(df, preserve_index=False), index_price, expiration_bounds, fetched_at
+
+def get_okx_data(currency: str, as_of):
+    """
+    Uncached wrapper around load_okx_data that shows the request debug panel and reports request and
+    parsing errors, and empty chains, in the app.
+    Returns the same tuple, with an empty table, no index price, no bounds and no fetch time on failure.
+    """
+    (options_url, options_params), (index_url, index_params) = _okx_requests(currency)
+
+    # --- Debugging: Print the full URLs being requested ---
+    full_options_url = f"{options_url}?{requests.utils.urlencode(options_params)}"
+    full_index_url = f"{index_url}?{requests.utils.urlencode(index_params)}"
+    st.subheader("⚙️ Debugging API Request:")
+    st.write(f"**1. Requesting Options Instruments URL:** `{full_options_url}`")
+    st.write(f"**2. Requesting Index Price URL:** `{full_index_url}`")
+
+    # Browser User-Agent and JSON Accept headers are set once on the shared session
+    st.write(f"**3. Request Headers:** `{dict(_SESSION.headers)}`")
+
+    try:
+        options_data = load_okx_data(currency, as_of)
+    except NoOptionsDataError as e:
+        st.warning(str(e))
     except requests.exceptions.Timeout:
-        st.error(f"❌ API Request Timed Out after {request_timeout} seconds. This usually indicates network congestion, a slow connection, or the API server being unresponsive. Please check your internet connection and try again.")
-        return pd.DataFrame(), None
+        st.error(f"❌ API Request Timed Out after {REQUEST_TIMEOUT} seconds. This usually indicates network congestion, a slow connection, or the API server being unresponsive. Please check your internet connection and try again.")
     except requests.exceptions.HTTPError as e:
         st.error(f"❌ HTTP Error fetching data from OKX: {e}. Status code: {e.response.status_code}. "
                  f"Response: {e.response.text}")
         st.info("This often means the URL or parameters are incorrect, or the API has changed.")
-        return pd.DataFrame(), None
+    except OKXAPIError as e:
+        st.error(f"❌ OKX API Error: {e}. The request succeeded but OKX rejected it.")
     except requests.exceptions.RequestException as e:
         st.error(f"❌ General Request Error fetching data from OKX: {e}. "
                  f"This could be a connection issue (DNS, firewall) or an unexpected API response format.")
-        return pd.DataFrame(), None
     except Exception as e:
         st.error(f"❌ An unexpected error occurred during data processing: {e}. This might indicate an issue with the JSON format or data parsing after a successful request.")
-        return pd.DataFrame(), None
+    else:
+        # --- Debugging: Print status code and response text of the responses behind this chain ---
+        responses = _RESPONSE_LOG.get(currency)
+        if responses:
+            st.write(f"**4. Options Instruments Response Status Code:** `{responses['options_status']}`")
+            st.write(f"**5. Options Instruments Raw Response Content (first 500 chars):** `{responses['options_head']}`")
+            st.write(f"**6. Index Price Response Status Code:** `{responses['index_status']}`")
+            st.write(f"**7. Index Price Raw Response Content (first 500 chars):** `{responses['index_head']}`")
+        return options_data
+    return pa.table({}), None, {}, None
+
+def _prefetch_okx_data(currency: str, as_of):
+    """
+    Background-thread target that warms load_okx_data's cache. There is no script context to report to,
+    so failures are logged instead of shown.
+    """
+    try:
+        load_okx_data(currency, as_of)
+    except NoOptionsDataError as e:
+        logger.warning("Prefetching %s options from OKX found nothing to show: %s", currency, e)
+    except Exception:
+        logger.exception("Prefetching %s options from OKX failed", currency)
+
+# --- Helper Functions to Build Charts ---
+
+@st.cache_resource(ttl=300)
+def build_fig(currency: str, expiration_str: str, fetched_at: float, index_price,
+              _call_strikes, _call_volumes, _put_strikes, _put_volumes):
+    """
+    Builds the volume-by-strike figure for one expiration. Strike/volume arrays must be strike-ordered.
+    The figure is cached as a live object (st.cache_resource, not pickled), so a rerun hands the already
+    validated go.Figure straight to st.plotly_chart; callers must not mutate it. The cache key is
+    (currency, expiration, fetch time, index price): the underscore-prefixed arrays are not hashed,
+    since fetched_at already pins the chain snapshot they were sliced from.
+    """
+    n_calls = len(_call_strikes)
+    n_puts = len(_put_strikes)
+    call_color = 'rgba(0, 150, 250, 0.6)'
+    put_color = 'rgba(255, 100, 100, 0.6)'
+
+    bar_strikes = np.concatenate([_call_strikes, _put_strikes])
+
+    # Traces and layout are plain dicts passed to go.Figure at once: one validation pass instead of one per add_trace
+    data = []
+
+    # Add Asset Price Line (Primary Y-axis)
+    if index_price:
+        # Ensure strikes are within a reasonable range for the line
+        # Handle cases where there are no strikes (e.g., if all volume is 0)
+        if len(bar_strikes):
+            # Both slices are strike-ordered, so the extremes are their end points; no full reduction needed
+            strike_slices = [a for a in (_call_strikes, _put_strikes) if len(a)]
+            min_strike = float(min(a[0] for a in strike_slices))
+            max_strike = float(max(a[-1] for a in strike_slices))
+        else: # Fallback if no options for this expiration, maybe use a default range
+            min_strike = index_price * 0.8
+            max_strike = index_price * 1.2
+
+        data.append(dict(
+            type='scattergl',
+            x=[min_strike, max_strike],
+            y=[index_price, index_price],
+            mode='lines',
+            name=f'{currency} Index Price',
+            line=dict(color='orange', dash='dash'),
+            yaxis='y1',
+            hoverinfo='name+y'
+        ))
+
+    # Add Call and Put Volume Bars (Secondary Y-axis). They stay two real traces so the unified hover lists
+    # both volumes at a strike and each legend entry toggles its own bars.
+    # Reproduce the grouped layout: calls sit left of their strike, puts right, each half the tightest spacing
+    distinct_strikes = np.unique(bar_strikes)
+    bar_width = float(np.diff(distinct_strikes).min()) / 2 if len(distinct_strikes) > 1 else 0.5
+    for label, color, offset, strikes, volumes in (
+        ('Call', call_color, -bar_width, _call_strikes, _call_volumes),
+        ('Put', put_color, 0, _put_strikes, _put_volumes),
+    ):
+        if len(strikes):
+            # Bars get native lists so Plotly skips array conversion
+            data.append(dict(
+                type='bar',
+                x=strikes.tolist(),
+                y=volumes.tolist(),
+                width=bar_width,
+                offset=offset,
+                name=f'{label} Volume (24h)',
+                marker=dict(color=color),
+                yaxis='y2',
+                hovertemplate=f'Strike: %{{x}}<br>{label} Vol: %{{y}}<extra></extra>'
+            ))
+
+    layout = dict(
+        title=f'{currency} Options Volume by Strike for {expiration_str}',
+        xaxis=dict(title='Strike Price'),
+        yaxis=dict(
+            title=f'{currency} Price (USD)',
+            titlefont=dict(color='orange'),
+            tickfont=dict(color='orange'),
+            side='left'
+        ),
+        yaxis2=dict(
+            title='24h Volume (Contracts)',
+            titlefont=dict(color='grey'),
+            tickfont=dict(color='grey'),
+            overlaying='y', 
+            side='right'
+        ),
+        legend=dict(x=0.01, y=0.99, bgcolor='rgba(255,255,255,0.7)'),
+        hovermode='x unified' if n_calls + n_puts < UNIFIED_HOVER_MAX_BARS else 'closest',
+        width=CHART_WIDTH,
+        height=600,
+        template="plotly_dark",
+        uirevision=currency # Keep pan/zoom state across reruns for the same currency
+    )
+
+    return go.Figure(dict(data=data, layout=layout))
+
+# --- Widget Callbacks ---
+
+def _remember_static_chart_choice():
+    """
+    on_change callback for the static-chart checkbox. Storing the choice outside the widget's own key
+    keeps it across runs where the checkbox isn't rendered, when Streamlit drops keyed widget state.
+    """
+    st.session_state['static_chart_choice'] = st.session_state['static_chart']
 
 # --- Rest of your Streamlit Dashboard code remains the same ---
 st.set_page_config(layout="wide", page_title="Crypto Options Dashboard")
@@ -114,124 +449,93 @@ st.markdown(
 
 # --- Sidebar Controls ---
 st.sidebar.header("Controls")
-selected_currency = st.sidebar.selectbox("Select Crypto:", ["BTC", "ETH"])
+selected_currency = st.sidebar.selectbox("Select Crypto:", CURRENCIES)
 
-# Re-enable cache after debugging, but ensure it wraps the function
+# Restore the spinner once the debug output is removed from get_okx_data
 # with st.spinner(f"Fetching {selected_currency} options data..."):
-#     options_df, index_price = get_okx_data(selected_currency)
+#     options_table, index_price, expiration_bounds, fetched_at = get_okx_data(selected_currency, today)
 # Temporarily call directly for debugging
-options_df, index_price = get_okx_data(selected_currency) # No spinner for now, as debug messages appear during call
+today = datetime.now().date()
+options_table, index_price, expiration_bounds, fetched_at = get_okx_data(selected_currency, today) # No spinner for now, as debug messages appear during call
 
-if options_df.empty:
-    st.info("No data available for the selected currency or an error occurred. Please try again later.")
-else:
-    # Get unique expiration dates
-    # Ensure to get unique dates after conversion to datetime for consistent grouping
-    expiration_dates = sorted(options_df['expiration_date'].dt.normalize().unique()) # Normalize to remove time component
-    
-    # Filter out past expiration dates for cleaner display
-    current_date_floor = pd.Timestamp.now().floor('D')
-    expiration_dates = [d for d in expiration_dates if d >= current_date_floor]
+# Warm the cache for the other currencies once per session, so switching in the sidebar doesn't block on OKX
+if options_table.num_rows and 'prefetched' not in st.session_state:
+    st.session_state['prefetched'] = True
+    for other_currency in CURRENCIES:
+        if other_currency != selected_currency:
+            threading.Thread(target=_prefetch_okx_data, args=(other_currency, today), daemon=True).start()
 
-    if not expiration_dates:
-        st.warning(f"No future expiration dates available for {selected_currency}.")
-        st.stop() # Stop execution if no valid dates
+fetch_stats = load_okx_data.stats
+st.sidebar.caption(f"OKX data cache: hits={fetch_stats['hits']} misses={fetch_stats['misses']} last={fetch_stats['last_ms']:.1f}ms")
 
-    # Format for display
-    expiration_options = {d.strftime('%Y-%m-%d'): d for d in expiration_dates}
+if options_table.num_rows == 0:
+    st.info("No data available for the selected currency or an error occurred. Please try again later.")
+else:
+    # Expiration dates come straight from the cached per-expiration slices, already formatted for
+    # display, so a rerun never scans the chain; ISO dates sort chronologically.
+    # get_okx_data has already dropped everything that expired before today.
+    expiration_labels = sorted({day for day, _ in expiration_bounds})
     
     selected_expiration_str = st.sidebar.selectbox(
         "Select Expiration Date:",
-        options=list(expiration_options.keys()),
+        options=expiration_labels,
         index=0 # Default to the first available future expiration
     )
     
     if selected_expiration_str:
-        selected_expiration = expiration_options[selected_expiration_str]
-        
-        # Filter DataFrame by selected expiration (compare normalized dates)
-        filtered_df = options_df[options_df['expiration_date'].dt.normalize() == selected_expiration].copy()
+        # Look up the precomputed row slices for the selected expiration instead of scanning the chain
+        no_rows = slice(0, 0)
+        calls_rows = expiration_bounds.get((selected_expiration_str, 'call'), no_rows)
+        puts_rows = expiration_bounds.get((selected_expiration_str, 'put'), no_rows)
+        expiration_rows = [rows for rows in (calls_rows, puts_rows) if rows.stop > rows.start]
 
-        if filtered_df.empty:
+        if not expiration_rows:
             st.warning(f"No options data for expiration {selected_expiration_str}. Please select another date.")
         else:
             # --- Plotting ---
-            fig = go.Figure()
+            # The validated figure is cached per (currency, expiration, chain snapshot), so reruns that keep
+            # the same expiration reuse it as-is: no rebuild, no re-validation, no hashing of the strike/volume arrays
+            strikes = options_table.column('strike').to_numpy()
+            volumes = options_table.column('volume_24h').to_numpy()
+            fig = build_fig(
+                selected_currency,
+                selected_expiration_str,
+                fetched_at,
+                index_price,
+                strikes[calls_rows],
+                volumes[calls_rows],
+                strikes[puts_rows],
+                volumes[puts_rows]
+            )
 
-            # Add Asset Price Line (Primary Y-axis)
             if index_price:
-                # Ensure strikes are within a reasonable range for the line
-                # Handle cases where filtered_df might have no strikes (e.g., if all volume is 0)
-                if not filtered_df.empty:
-                    min_strike = filtered_df['strike'].min()
-                    max_strike = filtered_df['strike'].max()
-                else: # Fallback if no options in filtered_df, maybe use a default range
-                    min_strike = index_price * 0.8
-                    max_strike = index_price * 1.2
-
-                fig.add_trace(go.Scatter(
-                    x=[min_strike, max_strike],
-                    y=[index_price, index_price],
-                    mode='lines',
-                    name=f'{selected_currency} Index Price',
-                    line=dict(color='orange', dash='dash'),
-                    yaxis='y1',
-                    hoverinfo='name+y'
-                ))
                 st.sidebar.markdown(f"**Current {selected_currency} Index Price:** `{index_price:,.2f} USD`")
             else:
                 st.sidebar.warning(f"Could not retrieve current {selected_currency} index price.")
 
-            # Add Call Volume Bars (Secondary Y-axis)
-            calls_df = filtered_df[filtered_df['option_type'] == 'call'].sort_values('strike')
-            if not calls_df.empty:
-                fig.add_trace(go.Bar(
-                    x=calls_df['strike'],
-                    y=calls_df['volume_24h'],
-                    name='Call Volume (24h)',
-                    marker_color='rgba(0, 150, 250, 0.6)', 
-                    yaxis='y2',
-                    hovertemplate='Strike: %{x}<br>Call Vol: %{y}<extra></extra>'
-                ))
-
-            # Add Put Volume Bars (Secondary Y-axis)
-            puts_df = filtered_df[filtered_df['option_type'] == 'put'].sort_values('strike')
-            if not puts_df.empty:
-                fig.add_trace(go.Bar(
-                    x=puts_df['strike'],
-                    y=puts_df['volume_24h'],
-                    name='Put Volume (24h)',
-                    marker_color='rgba(255, 100, 100, 0.6)', 
-                    yaxis='y2',
-                    hovertemplate='Strike: %{x}<br>Put Vol: %{y}<extra></extra>'
-                ))
-
-            fig.update_layout(
-                title=f'{selected_currency} Options Volume by Strike for {selected_expiration_str}',
-                xaxis_title='Strike Price',
-                yaxis=dict(
-                    title=f'{selected_currency} Price (USD)',
-                    titlefont=dict(color='orange'),
-                    tickfont=dict(color='orange'),
-                    side='left'
-                ),
-                yaxis2=dict(
-                    title='24h Volume (Contracts)',
-                    titlefont=dict(color='grey'),
-                    tickfont=dict(color='grey'),
-                    overlaying='y', 
-                    side='right'
-                ),
-                legend=dict(x=0.01, y=0.99, bgcolor='rgba(255,255,255,0.7)'),
-                hovermode='x unified', 
-                height=600,
-                template="plotly_dark" 
+            # A static chart skips Plotly's hover/zoom machinery in the browser. Until the user changes the box
+            # themselves, it follows the selected expiration: on for heavy chains, off otherwise.
+            n_bars = (calls_rows.stop - calls_rows.start) + (puts_rows.stop - puts_rows.start)
+            st.session_state['static_chart'] = st.session_state.get('static_chart_choice', n_bars > STATIC_CHART_MIN_BARS)
+            static_chart = st.sidebar.checkbox(
+                "Static chart (faster, no hover/zoom)", key='static_chart', on_change=_remember_static_chart_choice
             )
+            chart_config = {}
+            if static_chart:
+                chart_config.update(staticPlot=True, displayModeBar=False)
 
-            st.plotly_chart(fig, use_container_width=True)
+            # Rendered at the figure's own fixed width, so Streamlit doesn't resize it with the container
+            st.plotly_chart(fig, width="content", config=chart_config)
 
             if st.checkbox("Show raw data"):
                 st.subheader("Raw Data (Filtered)")
-                st.dataframe(filtered_df)
+                # Calls sort ahead of puts, so the expiration's rows form one contiguous block of the chain
+                first_row, last_row = expiration_rows[0].start, expiration_rows[-1].stop
+                # Fixed height keeps the grid virtually scrolled, so long chains don't render every row at once
+                # Only the chain's own columns are shown; expiration_day is an internal grouping helper
+                raw_rows = options_table.slice(first_row, last_row - first_row).select(
+                    ['instrument_name', 'strike', 'option_type', 'volume_24h', 'expiration_date']
+                )
+                st.dataframe(raw_rows, width="stretch", height=400)
     else:
         st.info("No expiration dates available for the selected currency.")